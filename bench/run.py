@@ -0,0 +1,209 @@
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from os.path import abspath, dirname, join
+from random import Random
+from tempfile import mkdtemp
+from shutil import rmtree
+
+import synthetic
+from dsf_lib import BUCKETS, Line, elevation, readDSF
+from osm import convert, openOSM
+from osm_database import OSMDatabase
+
+# Offline benchmarks for the DSF reader, mesh queries and OSM parsing.
+# Results go to JSON so runs on different commits can be compared:
+#   python bench/run.py -o before.json
+#   python bench/run.py -o after.json --compare before.json
+
+CLI = join(dirname(dirname(abspath(__file__))), 'src', 'cli.py')
+
+SIZES = {
+    'quick': {'triangles': 5000, 'queries': 2000, 'nodes': 20000, 'ways': 2000, 'repeat': 1},
+    'default': {'triangles': 50000, 'queries': 20000, 'nodes': 200000, 'ways': 20000, 'repeat': 3},
+    'large': {'triangles': 250000, 'queries': 100000, 'nodes': 1000000, 'ways': 100000, 'repeat': 3},
+}
+
+def measure(function, repeat, memory=True):
+    # Best and mean wall time over repeat runs, then peak traced memory of one
+    # more run. tracemalloc slows Python code down a lot, so it is kept out of the timed runs.
+    times = []
+    for i in range(repeat):
+        clock = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - clock)
+    result = {'seconds': min(times), 'mean': sum(times) / len(times), 'repeat': repeat, 'peak_bytes': None}
+    if not memory:
+        return result
+    tracemalloc.start()
+    try:
+        function()
+        (current, peak) = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    result['peak_bytes'] = peak
+    return result
+
+def parseOSM(osm_path):
+    database = OSMDatabase()
+    counts = {'nodes': 0, 'ways': 0}
+    def sink(kind, batch, tags):
+        counts[kind] += len(batch)
+    database.sink = sink
+    fd = openOSM(osm_path)
+    try:
+        while True:
+            data = fd.read(1 << 20)
+            if not data:
+                break
+            database.Feed(data)
+        database.Feed(b'', True)
+    finally:
+        fd.close()
+    return counts
+
+def tagMemory(osm_path):
+    # Bytes held for tags by the packed layout, against what the earlier
+    # layout held for the same tags: a list of '{k} = {v}' strings per node
+    # and a (way id, k, v) tuple, with its own strings, per way tag.
+    database = OSMDatabase()
+    batches = []
+    database.sink = lambda kind, batch, tags: batches.append((kind, tags))
+    fd = openOSM(osm_path)
+    try:
+        database.Feed(fd.read(), True)
+    finally:
+        fd.close()
+    table = database.tagtable
+    packed = sum([sys.getsizeof(table.keyids), sys.getsizeof(table.valueids), sys.getsizeof(table.keys), sys.getsizeof(table.values)] +
+                 [sys.getsizeof(s) for s in table.keys + table.values])
+    baseline = 0
+    for (kind, tags) in batches:
+        packed += sys.getsizeof(tags.ids) + sys.getsizeof(tags.offsets)
+        for i in range(len(tags)):
+            items = table.items(tags[i])
+            if kind == 'nodes':
+                strings = ['{0} = {1}'.format(k, v) for (k, v) in items]
+                baseline += sys.getsizeof(strings) + sum([sys.getsizeof(s) for s in strings])
+            else:
+                baseline += sum([sys.getsizeof((0, k, v)) + sys.getsizeof(k) + sys.getsizeof(v) for (k, v) in items])
+    return {'tag_bytes': packed, 'baseline_tag_bytes': baseline, 'ratio': baseline / float(packed)}
+
+def queries(count, seed=0, west=-5, south=51):
+    random = Random(seed)
+    return [(west + random.random(), south + random.random()) for i in range(count)]
+
+def run(size, workdir, memory=True):
+    results = []
+    def record(name, params, function, traced=True):
+        result = {'name': name, 'params': params}
+        result.update(measure(function, size['repeat'], memory and traced))
+        results.append(result)
+        sys.stderr.write('{0:<40} {1:10.4f}s {2:>12} bytes\n'.format(
+            ' '.join([name] + ['{0}={1}'.format(k, params[k]) for k in ('encoding', 'command', 'bz2') if k in params])[:40],
+            result['seconds'], str(result['peak_bytes'])))
+        return result
+
+    # Batch scripts start the CLI once per tile, so its startup time matters
+    for command in (['--help'], ['dsf', '--help']):
+        record('cli', {'command': ' '.join(command)},
+               lambda: subprocess.check_call([sys.executable, CLI] + command, stdout=subprocess.DEVNULL), False)
+
+    dsf_path = join(workdir, 'bench.dsf')
+    for encoding in synthetic.ENCODINGS:
+        for command in synthetic.COMMANDS:
+            params = synthetic.dsf(dsf_path, size['triangles'], encoding, command)
+            params.update({'encoding': encoding, 'command': command})
+            result = record('readDSF', params, lambda: readDSF(dsf_path))
+            # Triangles that made it into the buckets, which should match params['triangles']
+            result['stored_triangles'] = len(set([id(tri) for bucket in readDSF(dsf_path)[1] for tri in bucket]))
+
+    synthetic.dsf(dsf_path, size['triangles'], 3, 'triangles')
+    (lines, tris) = readDSF(dsf_path)
+    points = queries(size['queries'])
+    record('elevation', {'queries': len(points)},
+           lambda: [elevation(tris, -5, 51, lon, lat) for (lon, lat) in points])
+
+    def intersections():
+        hits = 0
+        for (lon, lat) in points:
+            line = Line((lon, lat, 0), (lon + 0.002, lat + 0.001, 0))
+            bucket = min(int((lat - 51) * BUCKETS), BUCKETS - 1) * BUCKETS + min(int((lon + 5) * BUCKETS), BUCKETS - 1)
+            for other in lines[bucket]:
+                if line.intersect(other):
+                    hits += 1
+        return hits
+    record('intersect', {'queries': len(points)}, intersections)
+
+    for compressed in (False, True):
+        osm_path = join(workdir, 'bench.osm' + (compressed and '.bz2' or ''))
+        params = synthetic.osm(osm_path, size['nodes'], size['ways'])
+        params['bz2'] = compressed
+        record('OSMDatabase', params, lambda: parseOSM(osm_path))
+
+    result = record('tags', {'nodes': size['nodes'], 'ways': size['ways']}, lambda: tagMemory(osm_path), False)
+    result.update(tagMemory(osm_path))
+    sys.stderr.write('{0:<40} {1:10d} bytes, {2:.1f}x smaller than strings\n'.format('tag storage', result['tag_bytes'], result['ratio']))
+
+    output_path = join(workdir, 'bench.txt')
+    record('convert', {'nodes': size['nodes'], 'ways': size['ways'], 'bz2': True},
+           lambda: convert(osm_path, output_path))
+    return results
+
+def revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=dirname(__file__) or '.',
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def key(result):
+    return json.dumps([result['name'], result['params']], sort_keys=True)
+
+def compare(results, baseline):
+    before = dict([(key(r), r) for r in baseline['results']])
+    for result in results:
+        old = before.get(key(result))
+        if old:
+            sys.stderr.write('{0:<40} {1:7.2f}x time {2:7.2f}x memory\n'.format(
+                result['name'], result['seconds'] / old['seconds'] if old['seconds'] else 0.0,
+                result['peak_bytes'] / float(old['peak_bytes']) if result['peak_bytes'] and old['peak_bytes'] else 0.0))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='py-osmxp benchmarks')
+    parser.add_argument('--size', choices=sorted(SIZES), default='default')
+    parser.add_argument('-o', '--output', help='JSON results file (default stdout)')
+    parser.add_argument('--no-memory', dest='memory', action='store_false', help='skip the tracemalloc peak memory runs')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+    args = parser.parse_args(argv)
+
+    workdir = mkdtemp(prefix='osmxp-bench-')
+    try:
+        results = run(SIZES[args.size], workdir, args.memory)
+    finally:
+        rmtree(workdir, True)
+
+    report = {
+        'revision': revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'size': args.size,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as fd:
+            json.dump(report, fd, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
+        sys.stdout.write('\n')
+    if args.compare:
+        with open(args.compare) as fd:
+            compare(results, json.load(fd))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+import sys
+from bz2 import BZ2File
+from hashlib import md5
+from math import ceil, cos, sin, sqrt
+from os.path import abspath, dirname, join
+from random import Random
+from struct import pack
+
+sys.path.insert(0, join(dirname(dirname(abspath(__file__))), 'src'))
+
+# Synthetic X-Plane DSF tiles and OSM extracts for benchmarking.
+
+ENCODINGS = (0, 1, 2, 3) # raw, differenced, RLE, RLE differenced
+COMMANDS = ('triangles', 'strip', 'fan', 'range')
+TERRAIN = b'lib/g10/terrain10/fst_tmp_dry_flat.ter'
+STRIP = 126 # Columns per strip command: 2 * (STRIP + 1) points, at most 255
+
+def atom(name, payload):
+    # Atom ids are stored byte reversed, sizes include the 8 byte atom header
+    return name[::-1].encode() + pack('<I', len(payload) + 8) + payload
+
+def runs(values):
+    # Split into (repeat, value) and (literal, values) runs of at most 127
+    i = 0
+    while i < len(values):
+        j = i + 1
+        while j < len(values) and j - i < 127 and values[j] == values[i]:
+            j += 1
+        if j - i > 2:
+            yield (True, values[i:j])
+            i = j
+            continue
+        j = i + 1
+        while j < len(values) and j - i < 127 and not (j + 2 < len(values) and values[j] == values[j + 1] == values[j + 2]):
+            j += 1
+        yield (False, values[i:j])
+        i = j
+
+def plane(values, encoding):
+    if encoding in (1, 3):
+        last = 0
+        deltas = []
+        for v in values:
+            deltas.append((v - last) & 0xffff)
+            last = v
+        values = deltas
+    if encoding in (0, 1):
+        return pack('<B{0}H'.format(len(values)), encoding, *values)
+    data = [pack('<B', encoding)]
+    for (repeat, run) in runs(values):
+        if repeat:
+            data.append(pack('<BH', 128 | len(run), run[0]))
+        else:
+            data.append(pack('<B{0}H'.format(len(run)), len(run), *run))
+    return b''.join(data)
+
+def pool(points, encoding):
+    data = [pack('<IB', len(points), 3)]
+    for i in range(3):
+        data.append(plane([p[i] for p in points], encoding))
+    return atom('POOL', b''.join(data))
+
+def batches(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def dsf(path, triangles=20000, encoding=3, command='triangles', west=-5, south=51, seed=0):
+    # Writes a mesh of about the requested number of triangles on a regular
+    # grid, using one coordinate pool per band of rows.
+    if encoding not in ENCODINGS or command not in COMMANDS:
+        raise ValueError((encoding, command))
+    random = Random(seed)
+    grid = max(1, int(ceil(sqrt(triangles / 2.0))))
+    phase = random.uniform(0, 6.28)
+
+    def vertex(i, j):
+        # raw lon, lat and elevation; elevation is a smooth surface plus noise
+        return (int(round(i * 65535.0 / grid)), int(round(j * 65535.0 / grid)),
+                int(30000 + 20000 * sin(phase + i * 0.05) * cos(j * 0.07)) + random.randint(0, 50))
+
+    if command == 'range':
+        rows = max(1, 21845 // (2 * grid)) # 3 points per triangle
+    else:
+        rows = max(1, 65535 // (grid + 1) - 1)
+
+    pools = []
+    cmds = [pack('<BB', 3, 0), pack('<BB', 17, 1)] # Terrain 0, physical
+    for band, j0 in enumerate(range(0, grid, rows)):
+        j1 = min(j0 + rows, grid)
+        cmds.append(pack('<BH', 1, band))
+        if command == 'range':
+            points = []
+            for j in range(j0, j1):
+                for i in range(grid):
+                    points.extend([vertex(i, j), vertex(i + 1, j), vertex(i + 1, j + 1)])
+                    points.extend([vertex(i, j), vertex(i + 1, j + 1), vertex(i, j + 1)])
+            pools.append(pool(points, encoding))
+            for first in range(0, len(points), 255):
+                cmds.append(pack('<BHH', 25, first, min(first + 255, len(points))))
+            continue
+
+        points = [vertex(i, j) for j in range(j0, j1 + 1) for i in range(grid + 1)]
+        pools.append(pool(points, encoding))
+        index = lambda i, j: (j - j0) * (grid + 1) + i
+        if command == 'triangles':
+            indices = []
+            for j in range(j0, j1):
+                for i in range(grid):
+                    indices.extend([index(i, j), index(i + 1, j), index(i + 1, j + 1),
+                                    index(i, j), index(i + 1, j + 1), index(i, j + 1)])
+            for chunk in batches(indices, 252):
+                cmds.append(pack('<BB{0}H'.format(len(chunk)), 23, len(chunk), *chunk))
+        elif command == 'strip':
+            # A command holds at most 255 points, so long rows are split
+            # into strips of up to STRIP columns
+            for j in range(j0, j1):
+                for i0 in range(0, grid, STRIP):
+                    strip = []
+                    for i in range(i0, min(i0 + STRIP, grid) + 1):
+                        strip.extend([index(i, j), index(i, j + 1)])
+                    cmds.append(pack('<BB{0}H'.format(len(strip)), 26, len(strip), *strip))
+        else:
+            for j in range(j0, j1):
+                for i in range(grid):
+                    fan = [index(i, j), index(i + 1, j), index(i + 1, j + 1), index(i, j + 1)]
+                    cmds.append(pack('<BB4H', 29, 4, *fan))
+
+    scal = atom('SCAL', pack('<6f', 1.0, west, 1.0, south, 5000.0, 0.0))
+    props = b''.join([k + b'\0' + v + b'\0' for (k, v) in [
+        (b'sim/west', str(west).encode()), (b'sim/south', str(south).encode()),
+        (b'sim/east', str(west + 1).encode()), (b'sim/north', str(south + 1).encode()),
+        (b'sim/planet', b'earth'), (b'sim/creation_agent', b'py-osmxp bench')]])
+    data = b'XPLNEDSF' + pack('<I', 1) + atom('HEAD', atom('PROP', props)) + \
+        atom('DEFN', atom('TERT', TERRAIN + b'\0')) + \
+        atom('GEOD', b''.join([p + scal for p in pools])) + \
+        atom('CMDS', b''.join(cmds))
+    with open(path, 'wb') as fd:
+        fd.write(data)
+        fd.write(md5(data).digest())
+    return {'grid': grid, 'pools': len(pools), 'triangles': 2 * grid * grid, 'bytes': len(data) + 16}
+
+HIGHWAYS = ('residential', 'residential', 'residential', 'service', 'tertiary', 'secondary', 'primary', 'footway', 'track')
+
+def osm(path, nodes=100000, ways=10000, waynodes=8, west=-5, south=51, seed=0):
+    # Writes an OSM XML extract, bzip2 compressed if path ends with .bz2
+    random = Random(seed)
+    fd = BZ2File(path, 'wb') if path.endswith('.bz2') else open(path, 'wb')
+    size = 0
+    try:
+        lines = [b'<?xml version="1.0" encoding="UTF-8"?>\n<osm version="0.6" generator="py-osmxp bench">\n']
+        for i in range(1, nodes + 1):
+            if i % 10:
+                lines.append('  <node id="{0}" lat="{1:.7f}" lon="{2:.7f}" version="1"/>\n'.format(
+                    i, south + random.random(), west + random.random()).encode())
+            else:
+                lines.append('  <node id="{0}" lat="{1:.7f}" lon="{2:.7f}" version="1">\n    <tag k="created_by" v="bench"/>\n    <tag k="name" v="Node {3}"/>\n  </node>\n'.format(
+                    i, south + random.random(), west + random.random(), i % 500).encode())
+            if len(lines) >= 10000:
+                size += fd.write(b''.join(lines))
+                lines = []
+        for i in range(1, ways + 1):
+            start = random.randint(1, max(1, nodes - waynodes))
+            lines.append('  <way id="{0}" version="1">\n'.format(i).encode())
+            lines.extend(['    <nd ref="{0}"/>\n'.format(start + j).encode() for j in range(waynodes)])
+            kind = random.random()
+            if kind < 0.8:
+                lines.append('    <tag k="highway" v="{0}"/>\n'.format(random.choice(HIGHWAYS)).encode())
+                lines.append('    <tag k="name" v="Street {0}"/>\n'.format(i % 1000).encode())
+            elif kind < 0.9:
+                lines.append(b'    <tag k="railway" v="rail"/>\n')
+            elif kind < 0.95:
+                lines.append(b'    <tag k="power" v="line"/>\n    <tag k="voltage" v="132000"/>\n')
+            else:
+                lines.append(b'    <tag k="building" v="yes"/>\n')
+            lines.append(b'  </way>\n')
+            if len(lines) >= 10000:
+                size += fd.write(b''.join(lines))
+                lines = []
+        lines.append(b'</osm>\n')
+        size += fd.write(b''.join(lines))
+    finally:
+        fd.close()
+    return {'nodes': nodes, 'ways': ways, 'bytes': size}
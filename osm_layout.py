@@ -1,4 +1,3 @@
-import urllib3
 from bz2 import BZ2File
 from math import cos, floor, radians
 from os import listdir, makedirs, system, spawnl, unlink, P_WAIT
@@ -0,0 +1,157 @@
+import os
+import sys
+import time
+
+STARTED = time.perf_counter()
+
+# Headless entry point for batch jobs. Subcommands import only what they use
+# and nothing here pulls in Kivy, so starting it stays cheap. urllib3 is only
+# loaded by download.
+#   python cli.py import extract.osm.bz2
+#   python cli.py dsf +51-005.dsf --elevation -4.5 51.5
+#   python cli.py convert extract.osm.bz2 roads.txt --dsf "Earth nav data"
+#   python cli.py download --tile -5 51
+
+def importOSM(args):
+    from osm import CHUNK, openOSM
+    from osm_database import OSMDatabase
+
+    database = OSMDatabase()
+    counts = {'nodes': 0, 'ways': 0}
+    features = {}
+    def sink(kind, batch, tags):
+        counts[kind] += len(batch)
+        if kind == 'ways':
+            for i in range(len(batch)):
+                feature = database.classify(tags[i])
+                if feature:
+                    features[feature] = features.get(feature, 0) + 1
+    database.sink = sink
+
+    fd = openOSM(args.osm)
+    try:
+        while True:
+            data = fd.read(CHUNK)
+            if not data:
+                break
+            database.Feed(data)
+        database.Feed(b'', True)
+    finally:
+        fd.close()
+
+    print('nodes\t{0}'.format(counts['nodes']))
+    print('ways\t{0}'.format(counts['ways']))
+    print('tag keys\t{0}'.format(len(database.tagtable.keys)))
+    print('tag values\t{0}'.format(len(database.tagtable.values)))
+    for feature in sorted(features):
+        print('{0}\t{1}'.format(feature, features[feature]))
+    return 0
+
+def inspectDSF(args):
+    from math import floor
+    from dsf_lib import BUCKETS, elevation, readDSF
+
+    result = readDSF(args.dsf)
+    if result is None:
+        sys.stderr.write('error: could not read {0}\n'.format(args.dsf))
+        return 1
+    (lines, tris) = result
+    print('triangles\t{0}'.format(len(set([id(tri) for bucket in tris for tri in bucket]))))
+    print('lines\t{0}'.format(len(set([line for bucket in lines for line in bucket]))))
+    if args.buckets:
+        for bucket in range(BUCKETS * BUCKETS):
+            print('bucket {0}\t{1}\t{2}'.format(bucket, len(tris[bucket]), len(lines[bucket])))
+    if args.elevation:
+        (lon, lat) = args.elevation
+        elev = elevation(tris, int(floor(lon)), int(floor(lat)), lon, lat)
+        print('elevation\t{0}'.format('' if elev is None else '{0:.2f}'.format(elev)))
+    return 0
+
+def convertOSM(args):
+    from osm import convert
+
+    def monitor(stats):
+        sys.stderr.write(' | '.join(['{0} {1} q{2}'.format(stage['stage'], stage['items'], stage['queue']) for stage in stats]) + '\n')
+
+    stats = convert(args.osm, args.output, args.dsf, args.progress and monitor or None, args.interval)
+    print('features\t{0}'.format(stats[-1]['items']))
+    return 0
+
+def downloadOSM(args):
+    from download import Downloader, tileURLs
+
+    urls = list(args.url)
+    for (west, south) in args.tile or []:
+        urls.extend(tileURLs(west, south))
+    if not urls:
+        sys.stderr.write('error: nothing to download\n')
+        return 1
+    downloader = Downloader(args.cache, args.workers)
+    for (url, path) in zip(urls, downloader.fetchAll(urls)):
+        print('{0}\t{1}'.format(url, path))
+    return 0
+
+def parser():
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='osmxp', description='OpenStreetMap to X-Plane, without the GUI')
+    parser.add_argument('--profile', help='capture cprofile, tracemalloc or both (comma separated) in the report; needs --report')
+    parser.add_argument('--report', help='write a JSON report of counters and timings to this path')
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    commands.required = True
+
+    command = commands.add_parser('import', help='parse an OSM extract and summarise it')
+    command.add_argument('osm', help='.osm or .osm.bz2 file')
+    command.set_defaults(function=importOSM)
+
+    command = commands.add_parser('dsf', help='read a DSF tile and summarise its mesh')
+    command.add_argument('dsf', help='.dsf file')
+    command.add_argument('--buckets', action='store_true', help='list triangles and lines per bucket')
+    command.add_argument('--elevation', nargs=2, type=float, metavar=('LON', 'LAT'), help='mesh elevation at a point')
+    command.set_defaults(function=inspectDSF)
+
+    command = commands.add_parser('convert', help='convert an OSM extract into roads, railways and power lines')
+    command.add_argument('osm', help='.osm or .osm.bz2 file')
+    command.add_argument('output', help='output file')
+    command.add_argument('--dsf', help='Earth nav data folder used for elevations')
+    command.add_argument('--progress', action='store_true', help='print pipeline progress to stderr')
+    command.add_argument('--interval', type=float, default=1.0, help='seconds between progress lines')
+    command.set_defaults(function=convertOSM)
+
+    command = commands.add_parser('download', help='fetch OSM extracts or API tiles into the local cache')
+    command.add_argument('url', nargs='*', help='URLs to fetch')
+    command.add_argument('--tile', nargs=2, type=int, action='append', metavar=('WEST', 'SOUTH'), help='fetch a 1x1 degree tile from the OSM API')
+    command.add_argument('--cache', default='cache', help='cache folder (default %(default)s)')
+    command.add_argument('--workers', type=int, default=4, help='concurrent transfers (default %(default)s)')
+    command.set_defaults(function=downloadOSM)
+    return parser
+
+def main(argv=None):
+    arguments = parser()
+    args = arguments.parse_args(argv)
+    reporting = args.profile or args.report
+    if reporting:
+        import instrument
+        if args.profile and not (args.report or os.environ.get(instrument.REPORT_ENV)):
+            arguments.error('--profile needs --report or {0} to write the profile to'.format(instrument.REPORT_ENV))
+        try:
+            profiles = instrument.parseProfiles(args.profile) if args.profile else None
+        except ValueError as e:
+            arguments.error(str(e))
+        instrument.start(args.command, profiles)
+        instrument.timing('cli.startup', time.perf_counter() - STARTED)
+
+    from dsf_errors import Error
+    try:
+        return args.function(args)
+    except (Error, IOError, ImportError, ValueError) as e:
+        sys.stderr.write('error: {0}\n'.format(str(e) or type(e).__name__))
+        return 1
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        if reporting:
+            instrument.finish(args.report)
+
+if __name__ == '__main__':
+    sys.exit(main())
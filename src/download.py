@@ -0,0 +1,271 @@
+import json
+import os
+import time
+from hashlib import sha256
+from os.path import exists, getsize, join
+from queue import Queue
+from tempfile import mkstemp
+from threading import Thread
+from dsf_errors import ErrorDownload
+from instrument import count
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt # Windows
+
+# Fetches OSM extracts and API bboxes through one urllib3 connection pool.
+# Bodies are stored once by their sha256 under cache/objects and an index file
+# per URL, cache/index/<sha256 of url>.json, maps it to its object with the
+# ETag and Last-Modified to revalidate it with. Interrupted transfers are kept
+# under cache/partial and resumed with Range.
+
+API = 'https://api.openstreetmap.org/api/0.6/map?bbox={0},{1},{2},{3}'
+API_STEP = 0.25 # Degrees. The API refuses bboxes larger than 0.25 square degrees.
+WORKERS = 4 # Concurrent transfers, and connections kept per host
+BLOCK = 1 << 16 # Bytes read from the network at a time
+RETRIES = 3 # Attempts after the first, each resuming where the last stopped
+TIMEOUT = 60.0 # Seconds to connect, and between reads
+
+def bboxURL(west, south, east, north, api=API):
+    return api.format(west, south, east, north)
+
+def tileURLs(west, south, step=API_STEP, api=API):
+    # API bboxes covering the 1x1 degree tile with this south west corner
+    n = int(round(1.0 / step))
+    return [bboxURL(west + i * step, south + j * step, west + (i + 1) * step, south + (j + 1) * step, api)
+            for j in range(n) for i in range(n)]
+
+def digest(path):
+    h = sha256()
+    fd = open(path, 'rb')
+    try:
+        while True:
+            data = fd.read(BLOCK)
+            if not data:
+                break
+            h.update(data)
+    finally:
+        fd.close()
+    return h.hexdigest()
+
+class Cache:
+    # Safe to share between threads and processes: every URL has its own
+    # index file, written atomically, and a lock held while its partial
+    # download is being written.
+    def __init__(self, root):
+        self.root = root
+        for folder in ('objects', 'partial', 'index', 'locks'):
+            os.makedirs(join(root, folder), exist_ok=True)
+
+    def object(self, sha):
+        return join(self.root, 'objects', sha[:2], sha)
+
+    def key(self, url):
+        return sha256(url.encode()).hexdigest()
+
+    def lookup(self, url):
+        # Index entry for url if its body is still in the cache
+        entry = self.read(join(self.root, 'index', self.key(url) + '.json'))
+        if entry and entry.get('url') == url and exists(self.object(entry['sha256'])):
+            return entry
+        return None
+
+    def partial(self, url):
+        return join(self.root, 'partial', self.key(url))
+
+    def store(self, url, path, validators):
+        # Move a complete download into the cache and index it
+        sha = digest(path)
+        target = self.object(sha)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if exists(target):
+            os.remove(path) # Same content from another URL
+        else:
+            os.replace(path, target)
+        entry = dict(validators)
+        entry.update({'url': url, 'sha256': sha, 'size': getsize(target), 'fetched': time.time()})
+        self.write(join(self.root, 'index', self.key(url) + '.json'), entry)
+        return entry
+
+    def revalidated(self, url, entry, validators):
+        entry = dict(entry)
+        entry.update(validators)
+        entry['fetched'] = time.time()
+        self.write(join(self.root, 'index', self.key(url) + '.json'), entry)
+        return entry
+
+    def acquire(self, url):
+        # Waits until this thread owns url's partial download and returns the
+        # lock to release(). It is an OS lock on a file under cache/locks, so
+        # it is dropped when its process dies and never needs taking over.
+        fd = os.open(join(self.root, 'locks', self.key(url)), os.O_CREAT | os.O_RDWR)
+        try:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            else:
+                while True:
+                    try:
+                        msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        pass # LK_LOCK gives up after 10 seconds
+        except:
+            os.close(fd)
+            raise
+        return fd
+
+    def release(self, fd):
+        if fcntl:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        os.close(fd)
+
+    def read(self, path):
+        # A missing or unreadable file is as good as no file
+        try:
+            fd = open(path)
+        except IOError:
+            return None
+        try:
+            return json.load(fd)
+        except ValueError:
+            return None
+        finally:
+            fd.close()
+
+    def write(self, path, data):
+        # Readers see the old file or the new one, never a partly written one
+        (handle, temp) = mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            fd = os.fdopen(handle, 'w')
+            try:
+                json.dump(data, fd, indent=1, sort_keys=True)
+            finally:
+                fd.close()
+            os.replace(temp, path)
+        except:
+            os.remove(temp)
+            raise
+
+def validators(headers):
+    return {'etag': headers.get('ETag'), 'last_modified': headers.get('Last-Modified')}
+
+class Downloader:
+    def __init__(self, cache_dir, workers=WORKERS, retries=RETRIES, timeout=TIMEOUT, headers=None):
+        import urllib3
+        self.urllib3 = urllib3
+        self.cache = Cache(cache_dir)
+        self.workers = workers
+        self.retries = retries
+        self.http = urllib3.PoolManager(maxsize=workers, block=True, retries=False,
+                                        timeout=urllib3.Timeout(connect=timeout, read=timeout),
+                                        headers=headers or {'User-Agent': 'py-osmxp'})
+
+    def fetch(self, url):
+        # Path to the cached body of url, downloading or revalidating it first.
+        # Only one transfer at a time, in any process, writes url's partial file.
+        lock = self.cache.acquire(url)
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    return self.cache.object(self._fetch(url)['sha256'])
+                except self.urllib3.exceptions.HTTPError as e:
+                    error = e
+                    count('download.retries')
+        finally:
+            self.cache.release(lock)
+        raise ErrorDownload('{0}: {1}'.format(url, error))
+
+    def _fetch(self, url):
+        entry = self.cache.lookup(url)
+        partial = self.cache.partial(url)
+        offset = exists(partial) and getsize(partial) or 0
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        elif offset:
+            headers['Range'] = 'bytes={0}-'.format(offset)
+            resume = self._validators(partial)
+            etag = resume.get('etag')
+            if etag and etag.startswith('W/'):
+                etag = None # Weak ETags can't be used with If-Range
+            if etag or resume.get('last_modified'):
+                # Only resume if the resource hasn't changed, otherwise the server sends it all
+                headers['If-Range'] = etag or resume.get('last_modified')
+
+        # A connection that drops early must raise, so the transfer is retried
+        # and resumed rather than stored short. urllib3 1.x doesn't by default.
+        response = self.http.request('GET', url, headers=headers, preload_content=False, enforce_content_length=True)
+        try:
+            if response.status == 304 and entry:
+                count('download.revalidated')
+                return self.cache.revalidated(url, entry, dict([(k, v) for (k, v) in validators(response.headers).items() if v]))
+            if response.status == 206 and offset and response.headers.get('Content-Range', '').startswith('bytes {0}-'.format(offset)):
+                count('download.resumed')
+                mode = 'ab'
+            elif response.status == 200:
+                mode = 'wb'
+            elif response.status in (206, 416) and offset:
+                # Our partial copy doesn't line up with the resource any more; start again
+                os.remove(partial)
+                raise self.urllib3.exceptions.HTTPError('{0}: HTTP {1} for a resumed transfer'.format(url, response.status))
+            else:
+                raise ErrorDownload('{0}: HTTP {1}'.format(url, response.status))
+
+            self._save(partial, validators(response.headers))
+            fd = open(partial, mode)
+            try:
+                for data in response.stream(BLOCK):
+                    fd.write(data)
+                    count('download.bytes', len(data))
+            finally:
+                fd.close()
+            entry = self.cache.store(url, partial, validators(response.headers))
+            os.remove(partial + '.json')
+            count('download.fetched')
+            return entry
+        finally:
+            response.release_conn()
+
+    def _validators(self, partial):
+        return self.cache.read(partial + '.json') or {}
+
+    def _save(self, partial, validators):
+        self.cache.write(partial + '.json', validators)
+
+    def fetchAll(self, urls):
+        # Paths for urls, in order, fetched concurrently. Raises the first
+        # error once every transfer has finished or failed.
+        urls = list(urls)
+        unique = list(dict.fromkeys(urls))
+        jobs = Queue()
+        for url in unique:
+            jobs.put(url)
+        results = {}
+        def work():
+            while True:
+                url = jobs.get()
+                if url is None:
+                    return
+                try:
+                    results[url] = self.fetch(url)
+                except Exception as e:
+                    results[url] = e
+
+        threads = [Thread(target=work, daemon=True) for i in range(min(self.workers, len(unique)))]
+        for thread in threads:
+            jobs.put(None)
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for url in unique:
+            if isinstance(results[url], Exception):
+                raise results[url]
+        return [results[url] for url in urls]
@@ -44,4 +44,7 @@ class ErrorBadChecksum(Error):
     pass
 
 class ErrorCanceled(Error):
+    pass
+
+class ErrorDownload(Error):
     pass
\ No newline at end of file
@@ -2,6 +2,7 @@ from math import cos, floor, pi, radians
 from os.path import basename, dirname, exists
 from struct import unpack
 from dsf_errors import ErrorNoAtoms, ErrorPoolOutOfRange, BadCommand
+from instrument import Phases, count
 
 # Number of buckets in a latitude and longitude
 BUCKETS = 16
@@ -133,8 +134,18 @@ class Tri:
     def __str__(self):
         return str((self.pt1, self.pt2, self.pt3))
 
+def elevation(tris, tilewest, tilesouth, lon, lat):
+    # Elevation of a point using the tris returned by readDSF, or None if no tri covers it.
+    bucket = min(int((lat - tilesouth) * BUCKETS), BUCKETS - 1) * BUCKETS + min(int((lon - tilewest) * BUCKETS), BUCKETS - 1)
+    for tri in tris[bucket]:
+        elev = tri.elev(lon, lat)
+        if elev is not None:
+            return elev
+    return None
+
 def readDSF(dsf_path):
     try:
+        timer = Phases('dsf')
         lines = [{} for i in range (BUCKETS  * BUCKETS)]
         tris = [[] for i in range(BUCKETS * BUCKETS)]
         
@@ -183,6 +194,8 @@ def readDSF(dsf_path):
         centralLat = tileSouth + 0.5
         centralLon = tileWest + 0.5
         
+        timer.mark('header')
+        
         # Jump to the end of the Header.
         dsfInfo.seek(headerEnd)
         
@@ -215,6 +228,8 @@ def readDSF(dsf_path):
             else:
                 dsfInfo.seek(unpackDSF - 8, 1)
         
+        timer.mark('definitions')
+        
         # If its not the Geodata Atom let's raise InvalidDSF
         if dsfInfo.read(4).decode() != 'DOEG':
             raise ErrorNoAtoms
@@ -286,6 +301,8 @@ def readDSF(dsf_path):
                     new_pool[j].append(current_pool[plane][j] * scale + offset)
             pool[i] = new_pool
         
+        timer.mark('pools')
+        
         # Commands Atom
         if dsfInfo.read(4).decode() != 'SDMC':
             raise ErrorNoAtoms
@@ -299,6 +316,7 @@ def readDSF(dsf_path):
         far = -1
         flags = 0 # 1 = physical, 2 = overlay
         current_terrain = 0
+        ntris = 0
         
         while dsfInfo.tell() < cmd_end:
             (cmd,) = unpack('<B', dsfInfo.read(1))
@@ -391,6 +409,7 @@ def readDSF(dsf_path):
                         tri = Tri(current_terrain, *points)
                         for bucket in tri.buckets(tileWest, tileSouth):
                             tris[bucket].append(tri)
+                        ntris += 1
                         for j in range(3):
                             line = Line(points[j], points[(j + 1) % 3])
                             for bucket in line.buckets(tileWest, tileSouth):
@@ -409,6 +428,7 @@ def readDSF(dsf_path):
                         tri = Tri(current_terrain, *points)
                         for bucket in tri.buckets(tileWest, tileSouth):
                             tris[bucket].append(tri)
+                        ntris += 1
                         for j in range(3):
                             line = Line(points[j], points[(j + 1) % 3])
                             for bucket in line.buckets(tileWest, tileSouth):
@@ -421,6 +441,7 @@ def readDSF(dsf_path):
                         tri = Tri(current_terrain, *current_pool[i:i + 3])
                         for bucket in tri.buckets(tileWest, tileSouth):
                             tris[bucket].append(tri)
+                        ntris += 1
                         for j in range(3):
                             line = Line(current_pool[i + j], current_pool[i + (j + 1) %3])
                             for bucket in line.buckets(tileWest, tileSouth):
@@ -440,11 +461,12 @@ def readDSF(dsf_path):
                             tri = Tri(current_terrain, points[i + 2], points[i + 1], points [i])
                         else:
                             tri=Tri(current_terrain, points[i], points[i + 1], points[i + 2])
-                            for bucket in tri.buckets(tileWest, tileSouth):
-                                tris[bucket].append(tri)
-                            for line in [Line(points[i], points[i + 1]), Line(points[i], points[i + 2])]:
-                                for bucket in line.buckets(tileWest, tileSouth):
-                                    lines[bucket][line] = True
+                        for bucket in tri.buckets(tileWest, tileSouth):
+                            tris[bucket].append(tri)
+                        ntris += 1
+                        for line in [Line(points[i], points[i + 1]), Line(points[i], points[i + 2])]:
+                            for bucket in line.buckets(tileWest, tileSouth):
+                                lines[bucket][line] = True
                     line = Line(points[unpackDSF - 2], points[unpackDSF - 1]) # Last Line
                     for bucket in line.buckets(tileWest, tileSouth):
                         lines[bucket][line] = True
@@ -463,11 +485,12 @@ def readDSF(dsf_path):
                             tri = Tri(current_terrain, points[i + 2], points[i + 1], points[i])
                         else:
                             tri = Tri(current_terrain, points[i], points[i + 1], points[i + 2])
-                            for bucket in tri.buckets(tileWest, tileSouth):
-                                tris[bucket].append(tri)
-                            for line in [Line(points[i], points[i + 1]), Line(points[i], points[i + 2])]:
-                                for bucket in line.buckets(tileWest, tileSouth):
-                                    lines[bucket][line] = True
+                        for bucket in tri.buckets(tileWest, tileSouth):
+                            tris[bucket].append(tri)
+                        ntris += 1
+                        for line in [Line(points[i], points[i + 1]), Line(points[i], points[i + 2])]:
+                            for bucket in line.buckets(tileWest, tileSouth):
+                                lines[bucket][line] = True
                     line = Line(points[unpackDSF - 2], points[unpackDSF - 1]) # Last Line
                     for bucket in line.buckets(tileWest, tileSouth):
                         lines[bucket][line] = True
@@ -482,11 +505,12 @@ def readDSF(dsf_path):
                             tri = Tri(current_terrain, points[ i + 2], points[i + 1], points[i])
                         else:
                             tri = Tri(current_terrain, points[i], points[ i + 1], points[i + 2])
-                            for bucket in tri.buckets(tileWest, tileSouth):
-                                tris[bucket].append(tri)
-                            for line in [Line(points[i], points[i + 1]), Line(points[i], points[i + 2])]:
-                                for bucket in line.buckets(tileWest, tileSouth):
-                                    lines[bucket][line] = True
+                        for bucket in tri.buckets(tileWest, tileSouth):
+                            tris[bucket].append(tri)
+                        ntris += 1
+                        for line in [Line(points[i], points[i + 1]), Line(points[i], points[i + 2])]:
+                            for bucket in line.buckets(tileWest, tileSouth):
+                                lines[bucket][line] = True
                     line = Line(points[unpackDSF - 2], points[unpackDSF -1]) # last line
                     for bucket in line.buckets(tileWest, tileSouth):
                         lines[bucket][line] = True
@@ -499,11 +523,12 @@ def readDSF(dsf_path):
                     points = []
                     for i in range(unpackDSF):
                         (d,) = unpack('<H', dsfInfo.read(2))
-                        points.appded(current_pool[d])
+                        points.append(current_pool[d])
                     for i in range(1, unpackDSF - 1):
                         tri = Tri(current_terrain, points[0], points[i], points[ i + 1])
                         for bucket in tri.buckets(tileWest, tileSouth):
                             tris[bucket].append(tri)
+                        ntris += 1
                         for line in [Line(points[0], points[i]), Line(points[i], points[i + 1])]:
                             for bucket in line.buckets(tileWest, tileSouth):
                                 lines[bucket][line] = True
@@ -524,6 +549,7 @@ def readDSF(dsf_path):
                         tri = Tri(current_terrain, points[0], points[i], points[i + 1])
                         for bucket in tri.buckets(tileWest, tileSouth):
                             tris[bucket].append(tri)
+                        ntris += 1
                         for line in [Line(points[0], points[i]), Line(points[i], points[i + 1])]:
                             for bucket in line.buckets(tileWest, tileSouth):
                                 lines[bucket][line] = True
@@ -538,6 +564,7 @@ def readDSF(dsf_path):
                         tri = Tri(current_terrain, current_pool[first], current_pool[i], current_pool[i + 1])
                         for bucket in tri.buckets(tileWest, tileSouth):
                             tris[bucket].append(tri)
+                        ntris += 1
                         for line in [Line(current_pool[first], current_pool[i]), Line(current_pool[i], current_pool[i + 1])]:
                             for bucket in line.buckets(tileWest, tileSouth):
                                 lines[bucket][line] = True
@@ -562,6 +589,13 @@ def readDSF(dsf_path):
         
         # Convert lines to lists
         lines = [bucket.keys() for bucket in lines]
+        timer.mark('commands')
+        
+        count('dsf.files')
+        count('dsf.bytes', dsfInfo.tell())
+        count('dsf.pools', len(pool))
+        count('dsf.triangles', ntris)
+        count('dsf.lines', len(set().union(*lines)))
         
         return(lines, tris)
         
@@ -569,6 +603,8 @@ def readDSF(dsf_path):
         pass
 
 if __name__ == '__main__':
-    lines, tris = readDSF(r'C:\Program Files (x86)\Steam\steamapps\common\X-Plane 11\Global Scenery\X-Plane 11 Demo Areas\Earth nav data\+20-160\+20-156\+20-156.dsf')
-    for tri in tris:
-        print(tri)
+    import sys
+    lines, tris = readDSF(sys.argv[1])
+    for bucket in range(BUCKETS * BUCKETS):
+        print(bucket, len(tris[bucket]), len(lines[bucket]))
+
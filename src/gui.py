@@ -0,0 +1,77 @@
+import kivy
+kivy.require('2.1.0')
+
+from kivy.app import App
+from kivy.clock import Clock
+from kivy.uix.label import Label
+from kivy.uix.tabbedpanel import TabbedPanel
+from kivy.lang import Builder
+from worker import Worker
+
+POLL = 0.2 # Seconds between checks for progress from the worker
+
+class OSMGUI(TabbedPanel):
+    worker = None
+    polling = None
+
+    def start_conversion(self):
+        if self.worker:
+            return
+        osm_path = self.ids.osm_path.text.strip()
+        if not osm_path:
+            self.ids.status.text = 'Choose an OSM file'
+            return
+        output_path = self.ids.output_path.text.strip() or osm_path.split('.osm')[0] + '.txt'
+        self.worker = Worker([(osm_path, output_path)], self.ids.dsf_dir.text.strip() or None)
+        self.worker.start()
+        self.ids.start.disabled = True
+        self.ids.cancel.disabled = False
+        self.ids.progress.max = 1
+        self.ids.progress.value = 0
+        self.ids.status.text = 'Starting'
+        # The conversion runs in another process; progress comes back here on the main thread.
+        self.polling = Clock.schedule_interval(self.poll, POLL)
+
+    def cancel_conversion(self):
+        if self.worker:
+            self.worker.cancel()
+            self.ids.cancel.disabled = True
+            self.ids.status.text = 'Cancelling'
+
+    def stop_conversion(self):
+        if self.worker:
+            self.worker.terminate()
+            self.finished()
+
+    def poll(self, dt):
+        for (event, value) in self.worker.poll():
+            if event == 'progress':
+                self.ids.status.text = 'Tile {0} of {1}: {2} elements, {3} features, {4:.0f} elements/s'.format(
+                    value['tile'] + 1, value['tiles'], value['elements'], value['features'], value['throughput'])
+            elif event == 'tiledone':
+                self.ids.progress.max = value['tiles']
+                self.ids.progress.value = value['tile']
+            elif event == 'done':
+                self.ids.status.text = 'Done in {0:.1f}s'.format(value['elapsed'])
+            elif event == 'cancelled':
+                self.ids.status.text = 'Cancelled'
+            elif event == 'error':
+                self.ids.status.text = value
+        if self.worker.finished:
+            self.finished()
+
+    def finished(self):
+        if self.polling:
+            self.polling.cancel()
+        self.polling = None
+        self.worker = None
+        self.ids.start.disabled = False
+        self.ids.cancel.disabled = True
+
+class PyOSMXP(App):
+    def build(self):
+        Builder.load_file('gui.kv')
+        return OSMGUI()
+    
+    def on_stop(self):
+        self.root.stop_conversion()
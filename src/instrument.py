@@ -0,0 +1,193 @@
+import atexit
+import os
+import sys
+import time
+from threading import Lock
+
+# Per run counters and timings, with optional cProfile and tracemalloc capture.
+#
+# PYOSMXP_PROFILE=cprofile,tracemalloc  turns on profiling for the whole run
+# PYOSMXP_REPORT=path                   writes a JSON report when the run ends.
+#                                       {pid} and {time} in the path are filled in.
+
+PROFILE_ENV = 'PYOSMXP_PROFILE'
+REPORT_ENV = 'PYOSMXP_REPORT'
+PROFILES = ('cprofile', 'tracemalloc')
+TOP = 30 # Functions and allocation sites kept in the report
+
+class Report:
+    def __init__(self, name=None):
+        self.name = name
+        self.lock = Lock()
+        self.counters = {}
+        self.timings = {} # name -> [seconds, calls]
+        self.extra = {}
+        self.profiles = set()
+        self.profilers = []
+        self.created = time.time()
+        self.started = time.perf_counter()
+        self.stopped = None
+        self.profile = None
+        self.memory = None
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def time(self, name, seconds, calls=1):
+        with self.lock:
+            timing = self.timings.setdefault(name, [0.0, 0])
+            timing[0] += seconds
+            timing[1] += calls
+
+    def record(self, name, value):
+        with self.lock:
+            self.extra[name] = value
+
+    def start(self, profiles=()):
+        self.profiles = set(profiles)
+        if 'tracemalloc' in self.profiles:
+            import tracemalloc
+            tracemalloc.start()
+        self.profilers = []
+        self.profiler()
+
+    def profiler(self):
+        # A started cProfile profiler for the calling thread, or None. cProfile
+        # only sees the thread that enabled it, so worker threads ask for their own.
+        if 'cprofile' not in self.profiles or self.stopped is not None:
+            return None
+        import cProfile
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            return None # Another profiler already owns this thread
+        with self.lock:
+            self.profilers.append(profiler)
+        return profiler
+
+    def stop(self):
+        if self.stopped is not None:
+            return
+        self.stopped = time.perf_counter()
+        if self.profilers:
+            import pstats
+            for profiler in self.profilers:
+                profiler.disable()
+            stats = pstats.Stats(*self.profilers)
+            functions = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:TOP] # by own time
+            self.profile = [{
+                'function': function,
+                'file': filename,
+                'line': line,
+                'calls': calls,
+                'tottime': tottime,
+                'cumtime': cumtime,
+            } for ((filename, line, function), (primitive, calls, tottime, cumtime, callers)) in functions]
+            self.profilers = []
+        if 'tracemalloc' in self.profiles:
+            import tracemalloc
+            if tracemalloc.is_tracing():
+                (current, peak) = tracemalloc.get_traced_memory()
+                top = tracemalloc.take_snapshot().statistics('lineno')[:TOP]
+                tracemalloc.stop()
+                self.memory = {
+                    'current': current,
+                    'peak': peak,
+                    'top': [{'site': str(stat.traceback), 'size': stat.size, 'count': stat.count} for stat in top],
+                }
+
+    def as_dict(self):
+        import platform
+        elapsed = (self.stopped or time.perf_counter()) - self.started
+        with self.lock:
+            report = {
+                'name': self.name,
+                'argv': sys.argv,
+                'pid': os.getpid(),
+                'python': platform.python_version(),
+                'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(self.created)),
+                'elapsed': elapsed,
+                'counters': dict(self.counters),
+                'timings': dict([(name, {'seconds': seconds, 'calls': calls}) for (name, (seconds, calls)) in self.timings.items()]),
+            }
+            report.update(self.extra)
+        if self.profile is not None:
+            report['profile'] = self.profile
+        if self.memory is not None:
+            report['memory'] = self.memory
+        return report
+
+    def write(self, path):
+        import json
+        path = path.format(pid=os.getpid(), time=time.strftime('%Y%m%d%H%M%S', time.gmtime(self.created)))
+        fd = open(path, 'w')
+        try:
+            json.dump(self.as_dict(), fd, indent=1)
+        finally:
+            fd.close()
+        return path
+
+class Phases:
+    # Times consecutive phases of one long function: each mark() records the
+    # time since the previous mark under prefix.name.
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.clock = time.perf_counter()
+
+    def mark(self, name):
+        clock = time.perf_counter()
+        current.time('{0}.{1}'.format(self.prefix, name), clock - self.clock)
+        self.clock = clock
+
+current = Report()
+
+def count(name, n=1):
+    current.count(name, n)
+
+def timing(name, seconds, calls=1):
+    current.time(name, seconds, calls)
+
+def record(name, value):
+    current.record(name, value)
+
+def profiler():
+    return current.profiler()
+
+def threadProfiler():
+    # profiler() for a worker thread. From Python 3.12 cProfile is built on
+    # sys.monitoring, which allows one profiler per process, so worker threads
+    # go without and only the main thread is profiled.
+    if sys.version_info >= (3, 12):
+        return None
+    return current.profiler()
+
+def parseProfiles(value):
+    profiles = [p.strip().lower() for p in (value or '').split(',') if p.strip()]
+    for p in profiles:
+        if p not in PROFILES:
+            raise ValueError('Unknown profile {0}, expected one of {1}'.format(p, ', '.join(PROFILES)))
+    return profiles
+
+def start(name=None, profiles=None):
+    # Begin a new run. profiles defaults to the PYOSMXP_PROFILE environment variable.
+    global current
+    current.stop()
+    current = Report(name)
+    current.start(parseProfiles(os.environ.get(PROFILE_ENV)) if profiles is None else profiles)
+    return current
+
+def finish(path=None):
+    # End the run and write its report to path, or to PYOSMXP_REPORT if set.
+    # Returns the path written, if any.
+    current.stop()
+    path = path or os.environ.get(REPORT_ENV)
+    if path:
+        return current.write(path)
+    return None
+
+# Runs that only set the environment variables are reported without any code changes.
+if os.environ.get(PROFILE_ENV) or os.environ.get(REPORT_ENV):
+    start(os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else None)
+    atexit.register(lambda: current.stopped is None and finish())
@@ -1,20 +1,10 @@
-import kivy
-kivy.require('2.1.0')
+from multiprocessing import freeze_support
 
-from kivy.app import App
-from kivy.uix.label import Label
-from kivy.uix.tabbedpanel import TabbedPanel
-from kivy.lang import Builder
-
-class OSMGUI(TabbedPanel):
-    pass
-
-Builder.load_file('gui.kv')
-
-class PyOSMXP(App):
-    def build(self):
-        return OSMGUI()
-    
+# Conversions run in a spawned process, which imports this module again as
+# __mp_main__. Kivy and the GUI are only imported below so that process
+# never loads them.
 
 if __name__ == '__main__':
-    PyOSMXP().run()
\ No newline at end of file
+    freeze_support()
+    from gui import PyOSMXP
+    PyOSMXP().run()
@@ -1,8 +1,155 @@
 import os
 import sys
+from bz2 import BZ2File
 from math import floor
-from queue import Queue
-from threading import Thread
-from time import sleep
-from traceback import format_exception_only, print_exc
- 
\ No newline at end of file
+from os.path import join
+from dsf_lib import readDSF, elevation
+from osm_database import OSMDatabase
+from pipeline import Pipeline, Stage
+
+CHUNK = 1 << 20 # Bytes read from the OSM file at a time
+TILECACHE = 4 # DSF tiles kept in memory while draping
+PARTIAL = '.part' # Suffix of output that is still being written
+
+def openOSM(osm_path):
+    if osm_path.endswith('.bz2'):
+        return BZ2File(osm_path, 'rb')
+    return open(osm_path, 'rb')
+
+def dsfPath(base, west, south):
+    # X-Plane layout, e.g. Earth nav data/+50-010/+51-005.dsf
+    return join(base, '{0:+03d}{1:+04d}'.format(int(floor(south / 10.0)) * 10, int(floor(west / 10.0)) * 10),
+                '{0:+03d}{1:+04d}.dsf'.format(south, west))
+
+class Reader:
+    # Source stage: chunks of raw OSM XML
+    def __init__(self, osm_path):
+        self.osm_path = osm_path
+
+    def __call__(self, emit):
+        fd = openOSM(self.osm_path)
+        try:
+            while True:
+                data = fd.read(CHUNK)
+                if not data:
+                    break
+                emit(data)
+        finally:
+            fd.close()
+
+class Parser:
+    # Chunks of XML -> (kind, batch, tags) for batches of Nodes, then of Ways
+    def __init__(self):
+        self.database = OSMDatabase()
+
+    def __call__(self, data, emit):
+        self.database.sink = lambda kind, batch, tags: emit((kind, batch, tags))
+        self.database.Feed(data)
+
+    def finish(self, emit):
+        self.database.sink = lambda kind, batch, tags: emit((kind, batch, tags))
+        self.database.Feed(b'', True)
+
+def elements(item):
+    # Nodes or Ways in a (kind, batch, tags) item from the Parser
+    return len(item[1])
+
+class Geometry:
+    # (kind, batch, tags) items -> batches of (feature, way id, [(lon, lat)])
+    def __init__(self, classify):
+        self.classify = classify
+        self.coords = {} # node id -> (lon, lat)
+
+    def __call__(self, item, emit):
+        (kind, batch, tags) = item
+        if kind == 'nodes':
+            coords = self.coords
+            for node in batch:
+                coords[int(node.id)] = (node.longitude / 10000000.0, node.latitude / 10000000.0)
+            return
+
+        features = []
+        for (i, way) in enumerate(batch):
+            feature = self.classify(tags[i])
+            if feature:
+                points = [self.coords[ref] for ref in way.nodes if ref in self.coords]
+                if len(points) >= 2:
+                    features.append((feature, way.id, points))
+        if features:
+            emit(features)
+
+class Drape:
+    # Adds the elevation of the DSF mesh to each point, or None without DSFs
+    def __init__(self, dsf_dir):
+        self.dsf_dir = dsf_dir
+        self.tiles = {} # (west, south) -> tris, oldest first
+
+    def tile(self, west, south):
+        if (west, south) not in self.tiles:
+            if len(self.tiles) >= TILECACHE:
+                del self.tiles[next(iter(self.tiles))]
+            result = readDSF(dsfPath(self.dsf_dir, west, south))
+            self.tiles[(west, south)] = result and result[1]
+        return self.tiles[(west, south)]
+
+    def __call__(self, features, emit):
+        draped = []
+        for (feature, id, points) in features:
+            line = []
+            for (lon, lat) in points:
+                west = int(floor(lon))
+                south = int(floor(lat))
+                tris = self.dsf_dir and self.tile(west, south)
+                line.append((lon, lat, tris and elevation(tris, west, south, lon, lat)))
+            draped.append((feature, id, line))
+        emit(draped)
+
+class Writer:
+    # One line per feature: feature, way id, then lon,lat,elevation points
+    def __init__(self, fd):
+        self.fd = fd
+
+    def __call__(self, features, emit):
+        lines = []
+        for (feature, id, points) in features:
+            lines.append('{0}\t{1}\t{2}\n'.format(feature, id, ' '.join(
+                ['{0:.7f},{1:.7f},{2}'.format(lon, lat, '' if elev is None else '{0:.2f}'.format(elev)) for (lon, lat, elev) in points])))
+        self.fd.writelines(lines)
+
+def conversion(osm_path, fd, dsf_dir=None):
+    # Build the pipeline that converts osm_path into features written to fd.
+    parser = Parser()
+    return Pipeline(Stage('read', Reader(osm_path)), [
+        Stage('parse', parser, parser.finish),
+        Stage('geometry', Geometry(parser.database.classify), size=elements),
+        Stage('dsf', Drape(dsf_dir)),
+        Stage('write', Writer(fd)),
+    ])
+
+def convert(osm_path, output_path, dsf_dir=None, monitor=None, interval=1.0, cancel=None):
+    # Output is written next to output_path and only renamed into place once
+    # complete, so a failed or cancelled conversion leaves nothing behind.
+    # cancel is an Event, checked every interval.
+    def watch(stats):
+        if cancel is not None and cancel.is_set():
+            pipeline.cancel()
+        if monitor:
+            monitor(stats)
+
+    partial = output_path + PARTIAL
+    fd = open(partial, 'w')
+    try:
+        pipeline = conversion(osm_path, fd, dsf_dir)
+        pipeline.run(watch, interval)
+        fd.close()
+        os.replace(partial, output_path)
+    except:
+        fd.close()
+        os.remove(partial)
+        raise
+    return pipeline.stats()
+
+if __name__ == '__main__':
+    def monitor(stats):
+        sys.stderr.write(' | '.join(['{0} {1} q{2}'.format(s['stage'], s['items'], s['queue']) for s in stats]) + '\n')
+    convert(sys.argv[1], sys.argv[2], len(sys.argv) > 3 and sys.argv[3] or None, monitor)
@@ -1,21 +1,24 @@
 import sys
+from array import array
 from bz2 import BZ2File
 from os.path import basename, exists
 from xml.parsers.expat import ParserCreate
 import time
+from instrument import count, timing
+from osm_tags import TagBatch, TagTable
 
 BATCH = 1000 # Database system. Will be implemented in Version 1.5
 
 class Node:
     def __init__(self, parent, attrs):
         self.parent = parent
-        parent._parser.StartElementhander = self.start
+        parent._parser.StartElementHandler = self.start
         
         self.id = attrs['id']
         self.latitude = int(float(attrs['lat']) * 10000000)
         self.longitude = int(float(attrs['lon']) * 10000000)
         
-        if 'visuble' in attrs:
+        if 'visible' in attrs:
             self.visible = (attrs['visible'] != 'false')
         else:
             self.visible = 1
@@ -24,20 +27,19 @@ class Node:
             self.action = attrs['action']
         else:
             self.action = None
-            self.tags = []
         
     
     def start(self, name, attrs):
         if name == 'tag':
             k = attrs['k']
             
-            if k != 'created_by': self.tags.append('{0} = {1}'.format(k, attrs['v']))
+            if k != 'created_by': self.parent.tagtable.add(self.parent.nodetags, k, attrs['v'])
     
     def end(self, name):
         self.parent._parser.EndElementHandler = self.parent.end
     
-    def values(self):
-        return (self.id, self.latitude, self.longitude, 1, self.visible, ';'.join(self.tags), self.parent.timestamp, 0)
+    def values(self, tags):
+        return (self.id, self.latitude, self.longitude, 1, self.visible, self.parent.tagtable.format(tags), self.parent.timestamp, 0)
     
 class Way:
     def __init__(self, parent, attrs):
@@ -54,102 +56,153 @@ class Way:
             self.action = attrs['action']
         else:
             self.action = None
-            self.nodecount = 0
+        self.nodecount = 0
+        self.nodes = array('q') # Node refs in order
         
     def start(self, name, attrs):
         if self.action != 'delete':
             if name == 'tag':
                 k = attrs['k']
                 if k != 'created_by':
-                    self.parent.waytags.append((self.id, k, attrs['v']))
-                elif name == 'nd':
-                    self.nodecount += 1
-                    self.parent.waynodes.append((self.id, attrs['ref'], self.nodecount))
-                    self.parent._parser.EndElementHandler = self.end
+                    self.parent.tagtable.add(self.parent.waytags, k, attrs['v'])
+            elif name == 'nd':
+                self.nodecount += 1
+                self.nodes.append(int(attrs['ref']))
+                self.parent._parser.EndElementHandler = self.end
     
     def end(self, name):
         self.parent._parser.EndElementHandler = self.parent.end
     
     def values(self):
-        return (self.id, 1, self.parenttimestamp, self.visible)
+        return (self.id, 1, self.parent.timestamp, self.visible)
 
 class OSMDatabase:
-    def __init__(self):
+    def __init__(self, sink=None):
         # self. curser = curser  # Not Implemented yet. Will add databse support in Version 1.5
         self.element = None
-        self.elementparser = self.start()
+        self._parser = None
+        self.sink = sink # sink(kind, batch, tags) receives each batch of 'nodes' or 'ways' as it is flushed, tags[i] being batch[i]'s
+        self.sinktime = 0.0 # Seconds spent in sink, kept out of osm.parse
+        self.tagtable = TagTable()
+        self.classify = self.tagtable.classifier()
         self.timestamp = time.strftime('%Y%m%d%H%m%S', time.gmtime())
         self.nodes = []
+        self.nodetags = TagBatch() # Tags of self.nodes
         self.ways = []
-        self.waytags = []
-        self.waynodes = []
+        self.waytags = TagBatch() # Tags of self.ways
     
     def Parse(self, name, data):
-        clock = time.clock() # Processor time
+        clock = self._clock()
         self._parser = ParserCreate()
         self._parser.StartElementHandler = self.start
         self._parser.EndElementHandler = self.end
         self._parser.Parse(data)
         self._parser = None
-        print('{0} time importing {1}'.format(time.clock() - clock, name))
+        self._timing(clock)
+        count('osm.files')
+        count('osm.bytes', len(data))
     
     def ParseFile(self, name, fd):
-        clock = time.clock() # Processor Time
+        clock = self._clock()
         self._parser = ParserCreate()
         self._parser.StartElementHandler = self.start
         self._parser.EndElementHandler = self.end
         self._parser.ParseFile(fd)
         self._parser = None
+        self._timing(clock)
+        count('osm.files')
+        count('osm.bytes', fd.tell())
         fd.close()
-        print('{0} time importing {1}'.format(time.clock() - clock, name))
+    
+    def Feed(self, data, final=False):
+        # Incremental parsing, for data that arrives in chunks.
+        clock = self._clock()
+        if self._parser is None:
+            self._parser = ParserCreate()
+            self._parser.StartElementHandler = self.start
+            self._parser.EndElementHandler = self.end
+        self._parser.Parse(data, final)
+        if final:
+            self._parser = None
+        self._timing(clock)
+        count('osm.bytes', len(data))
+        if final:
+            count('osm.files')
+    
+    def _clock(self):
+        return (time.perf_counter(), self.sinktime)
+    
+    def _timing(self, clock):
+        # osm.parse covers expat and building elements, not the sink's work
+        (started, sinktime) = clock
+        timing('osm.parse', time.perf_counter() - started - (self.sinktime - sinktime))
+    
+    def _emit(self, kind, batch, tags):
+        if self.sink:
+            clock = time.perf_counter()
+            self.sink(kind, batch, tags)
+            self.sinktime += time.perf_counter() - clock
     
     # http://wiki.openstreetmap.org/wiki/OSM_Protocol_Version_0.5
     def start(self, name, attrs):
         if name == 'node':
             self.element = Node(self, attrs)
         elif name == 'way':
+            if self.nodes:
+                self.addnodes() # Ways follow nodes, so flush them before the first way
             self.element = Way(self, attrs)
     
     def end(self, name):
         if name == 'node':
             if self.element.action == 'delete':
                 # Execute Database Delete. Database support starts in Version 1.5
-                pass
+                self.nodetags.drop()
+            else:
+                self.nodes.append(self.element)
+                self.nodetags.end()
             
             if len(self.nodes) >= BATCH:
                 self.addnodes()
-                self._parser.StartElementHandler = self.start
+            self._parser.StartElementHandler = self.start
         elif name == 'way':
                 if self.element.action:
                     if self.element.action =='delete':
-                        pass # Delete from database. Database support starts in Version 1.5
+                        self.waytags.drop() # Delete from database. Database support starts in Version 1.5
                     else:
-                        self.ways.append(self.element)
+                        self.addway(self.element)
                 else:
-                    self.ways.append(self.element)
+                    self.addway(self.element)
                     # TODO: Add in database insertion system. Database support starts in Version 1.5
+                
+                if len(self.ways) >= BATCH:
+                    self.addways()
+                    self.addwaytags()
+                self._parser.StartElementHandler = self.start
         elif name =='osm':
-            if self.nodses:
+            if self.nodes:
                 self.addnodes()
             if self.ways:
                 self.addways()
             if self.waytags:
                 self.addwaytags()
-            if self.waynodes:
-                self.addwaynodes()
                 
+    def addway(self, way):
+        self.ways.append(way)
+        self.waytags.end()
+    
     def addnodes(self):
         # Implement inserting nodes into database. Database support starts in Version 1.5
+        count('osm.nodes', len(self.nodes))
+        self._emit('nodes', self.nodes, self.nodetags)
         self.nodes = []
+        self.nodetags = TagBatch()
     
     def addways(self):
         # Implement inserting ways into database. Database support starts in Version 1.5
+        count('osm.ways', len(self.ways))
+        self._emit('ways', self.ways, self.waytags)
         self.ways = []
     
     def addwaytags(self):
         # Implement inserting waytags into database. Database support starts in Version 1.5
-        self.waytags = []
-    
-    def addwaynodes(self):
-        # Implement inserting waynodes into database. Database support starts in Version 1.5
-        self.waynodes = []
\ No newline at end of file
+        self.waytags = TagBatch()
@@ -0,0 +1,111 @@
+from array import array
+
+# Features we import, checked in this order. A value list of None matches
+# any value of the key.
+FEATURES = [
+    ('road', 'highway', ('motorway', 'motorway_link', 'trunk', 'trunk_link', 'primary', 'primary_link',
+                         'secondary', 'secondary_link', 'tertiary', 'tertiary_link', 'unclassified',
+                         'residential', 'living_street', 'service', 'road')),
+    ('railway', 'railway', ('rail', 'light_rail', 'narrow_gauge', 'subway', 'tram', 'monorail', 'funicular')),
+    ('powerline', 'power', ('line', 'minor_line')),
+]
+
+class TagTable:
+    # Keys and values are stored once and referred to by small integer ids.
+    # An element's tags are a packed array of alternating key and value ids.
+    def __init__(self):
+        self.keyids = {}
+        self.valueids = {}
+        self.keys = []
+        self.values = []
+
+    def key(self, k):
+        i = self.keyids.get(k)
+        if i is None:
+            i = self.keyids[k] = len(self.keys)
+            self.keys.append(k)
+        return i
+
+    def value(self, v):
+        i = self.valueids.get(v)
+        if i is None:
+            i = self.valueids[v] = len(self.values)
+            self.values.append(v)
+        return i
+
+    def add(self, batch, k, v):
+        # Adds k = v to the element batch is collecting
+        batch.ids.append(self.key(k))
+        batch.ids.append(self.value(v))
+
+    def items(self, tags):
+        keys = self.keys
+        values = self.values
+        return [(keys[tags[j]], values[tags[j + 1]]) for j in range(0, len(tags), 2)]
+
+    def format(self, tags):
+        return ';'.join(['{0} = {1}'.format(k, v) for (k, v) in self.items(tags)])
+
+    def predicate(self, k, values=None):
+        if values is None:
+            return TagPredicate(self.key(k), None)
+        return TagPredicate(self.key(k), frozenset([self.value(v) for v in values]))
+
+    def classifier(self, features=FEATURES):
+        return Classifier(self, features)
+
+class TagBatch:
+    # The tags of a batch of elements in one flat array, so an element costs
+    # an offset rather than an array of its own. Element i's tags are
+    # ids[offsets[i]:offsets[i + 1]].
+    def __init__(self):
+        self.ids = array('I')
+        self.offsets = array('I', [0])
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.ids[self.offsets[i]:self.offsets[i + 1]]
+
+    def end(self):
+        # Keeps the tags added since the last end() as the next element's
+        self.offsets.append(len(self.ids))
+
+    def drop(self):
+        # Forgets the tags added since the last end()
+        del self.ids[self.offsets[-1]:]
+
+class TagPredicate:
+    def __init__(self, key, values):
+        self.key = key
+        self.values = values
+
+    def __call__(self, tags):
+        for j in range(0, len(tags), 2):
+            if tags[j] == self.key:
+                return self.values is None or tags[j + 1] in self.values
+        return False
+
+class Classifier:
+    # Maps an element's tags to the name of the first matching feature, or None.
+    def __init__(self, table, features=FEATURES):
+        self.names = [name for (name, k, values) in features]
+        self.rules = {} # key id -> [(priority, value ids or None)]
+        for (priority, (name, k, values)) in enumerate(features):
+            predicate = table.predicate(k, values)
+            self.rules.setdefault(predicate.key, []).append((priority, predicate.values))
+
+    def __call__(self, tags):
+        rules = self.rules
+        best = None
+        for j in range(0, len(tags), 2):
+            rule = rules.get(tags[j])
+            if rule:
+                value = tags[j + 1]
+                for (priority, values) in rule:
+                    if (values is None or value in values) and (best is None or priority < best):
+                        best = priority
+        if best is None:
+            return None
+        return self.names[best]
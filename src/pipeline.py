@@ -0,0 +1,168 @@
+from queue import Queue, Empty, Full
+from threading import Event, Thread
+import time
+import instrument
+from dsf_errors import ErrorCanceled
+
+QUEUE_SIZE = 8 # Batches waiting between two stages. Keeps memory flat when a later stage is slower.
+POLL = 0.1 # Seconds between checks for cancellation while blocked on a queue.
+
+END = None # End of stream marker passed down the queues
+
+def size(batch):
+    # Items in a batch: elements in a list, bytes in a chunk of data
+    try:
+        return len(batch)
+    except TypeError:
+        return 1
+
+class Stage:
+    # function(batch, emit) is called for every batch from the previous stage
+    # and may emit any number of batches to the next. finish(emit) is called
+    # once at the end of the stream. The first stage of a pipeline is the
+    # source and is called once as function(emit). size(batch) gives the
+    # items in a batch for the stats.
+    def __init__(self, name, function, finish=None, maxsize=QUEUE_SIZE, size=size):
+        self.name = name
+        self.function = function
+        self.finish = finish
+        self.size = size
+        self.maxsize = maxsize
+        self.input = None
+        self.output = None
+        self.next = None
+        self.batches = 0
+        self.items = 0
+        self.emitted = 0
+        self.busy = 0.0
+        self.blocked = 0.0 # Time spent waiting on a full output queue
+        self.maxdepth = 0
+        self.started = None
+        self.stopped = None
+
+    def stats(self):
+        if self.started is None:
+            elapsed = 0.0
+        elif self.stopped is None:
+            elapsed = time.perf_counter() - self.started
+        else:
+            elapsed = self.stopped - self.started
+        return {
+            'stage': self.name,
+            'batches': self.batches,
+            'items': self.items,
+            'emitted': self.emitted,
+            'busy': self.busy,
+            'blocked': self.blocked,
+            'elapsed': elapsed,
+            'throughput': self.items / self.busy if self.busy else 0.0, # items per busy second
+            'queue': self.input.qsize() if self.input is not None else 0,
+            'maxqueue': self.maxdepth,
+            'done': self.stopped is not None,
+        }
+
+class Pipeline:
+    # Runs each stage in its own thread, connected by bounded queues.
+    def __init__(self, source, stages):
+        self.stages = [source] + list(stages)
+        for (previous, stage) in zip(self.stages, self.stages[1:]):
+            previous.output = stage.input = Queue(stage.maxsize)
+            previous.next = stage
+        self.cancelled = Event()
+        self.error = None
+        self.threads = []
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def stats(self):
+        return [stage.stats() for stage in self.stages]
+
+    def run(self, monitor=None, interval=1.0):
+        # Blocks until every stage has finished. monitor(stats), if given, is
+        # called from this thread every interval seconds and once at the end.
+        self.threads = [Thread(target=self._run, args=(stage,), name=stage.name, daemon=True) for stage in self.stages]
+        for thread in self.threads:
+            thread.start()
+        for thread in self.threads:
+            while thread.is_alive():
+                thread.join(interval)
+                if monitor and thread.is_alive():
+                    monitor(self.stats())
+        stats = self.stats()
+        if monitor:
+            monitor(stats)
+        for stage in stats:
+            instrument.timing('pipeline.' + stage['stage'], stage['busy'])
+            instrument.count('pipeline.{0}.items'.format(stage['stage']), stage['items'])
+        instrument.record('pipeline', stats)
+        if self.error is not None:
+            raise self.error
+        if self.cancelled.is_set():
+            raise ErrorCanceled
+
+    def _put(self, stage, batch):
+        if stage.output is None:
+            return
+        clock = time.perf_counter()
+        while True:
+            if self.cancelled.is_set():
+                raise ErrorCanceled
+            try:
+                stage.output.put(batch, timeout=POLL)
+                break
+            except Full:
+                pass
+        stage.blocked += time.perf_counter() - clock
+        stage.next.maxdepth = max(stage.next.maxdepth, stage.output.qsize())
+
+    def _get(self, stage):
+        while True:
+            if self.cancelled.is_set():
+                raise ErrorCanceled
+            try:
+                return stage.input.get(timeout=POLL)
+            except Empty:
+                pass
+
+    def _run(self, stage):
+        def emit(batch):
+            stage.emitted += 1
+            if stage.input is None:
+                stage.batches += 1
+                stage.items += stage.size(batch)
+            self._put(stage, batch)
+
+        profiler = None
+        stage.started = time.perf_counter()
+        try:
+            profiler = instrument.threadProfiler()
+            if stage.input is None:
+                stage.function(emit)
+            else:
+                while True:
+                    batch = self._get(stage)
+                    if batch is END:
+                        break
+                    stage.batches += 1
+                    stage.items += stage.size(batch)
+                    clock = time.perf_counter()
+                    blocked = stage.blocked
+                    stage.function(batch, emit)
+                    stage.busy += time.perf_counter() - clock - (stage.blocked - blocked)
+            if stage.finish:
+                stage.finish(emit)
+            if stage.output is not None:
+                self._put(stage, END)
+        except ErrorCanceled:
+            pass
+        except Exception as e:
+            if self.error is None:
+                self.error = e
+            self.cancelled.set()
+        finally:
+            stage.stopped = time.perf_counter()
+            if stage.input is None:
+                stage.busy = stage.stopped - stage.started - stage.blocked
+            if profiler:
+                profiler.disable()
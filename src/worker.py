@@ -0,0 +1,107 @@
+import os
+import time
+from multiprocessing import get_context
+from queue import Empty
+from traceback import format_exception_only
+from dsf_errors import ErrorCanceled, ErrorUserCancel
+
+INTERVAL = 0.5 # Seconds between progress events
+CANCEL_TIMEOUT = 5.0 # Seconds a cancelled worker gets to stop before it is terminated
+
+def progress(job, jobs, started, stats):
+    stages = dict([(stage['stage'], stage) for stage in stats])
+    elapsed = time.perf_counter() - started
+    elements = stages['geometry']['items'] # Nodes and ways out of the parser
+    return {
+        'tile': job,
+        'tiles': jobs,
+        'elements': elements,
+        'features': stages['write']['items'],
+        'bytes': stages['read']['items'],
+        'throughput': elements / elapsed if elapsed else 0.0, # elements per second
+        'stages': stats,
+    }
+
+def run(jobs, dsf_dir, events, cancel):
+    # Runs in the worker process. jobs is a list of (osm path, output path).
+    from osm import convert
+    started = time.perf_counter()
+    try:
+        for (i, (osm_path, output_path)) in enumerate(jobs):
+            if cancel.is_set():
+                raise ErrorUserCancel
+            events.put(('tile', {'tile': i, 'tiles': len(jobs), 'path': osm_path}))
+            clock = time.perf_counter()
+            convert(osm_path, output_path, dsf_dir,
+                    lambda stats: events.put(('progress', progress(i, len(jobs), clock, stats))),
+                    INTERVAL, cancel)
+            events.put(('tiledone', {'tile': i + 1, 'tiles': len(jobs), 'path': output_path}))
+        events.put(('done', {'tiles': len(jobs), 'elapsed': time.perf_counter() - started}))
+    except (ErrorCanceled, ErrorUserCancel):
+        events.put(('cancelled', None))
+    except Exception as e:
+        events.put(('error', ''.join(format_exception_only(type(e), e)).strip()))
+
+class Worker:
+    # Runs conversions in a separate process. The owner calls poll()
+    # regularly, e.g. from a Kivy Clock, to collect (event, value) pairs:
+    # tile, progress, tiledone, done, cancelled and error.
+    def __init__(self, jobs, dsf_dir=None):
+        context = get_context('spawn') # Never fork a process that holds a GL context
+        self.jobs = list(jobs)
+        self.events = context.Queue()
+        self.cancelled = context.Event()
+        self.process = context.Process(target=run, args=(self.jobs, dsf_dir, self.events, self.cancelled), daemon=True)
+        self.deadline = None
+        self.finished = False
+
+    def start(self):
+        self.process.start()
+
+    def cancel(self):
+        if not self.finished and self.deadline is None:
+            self.cancelled.set()
+            self.deadline = time.monotonic() + CANCEL_TIMEOUT
+
+    def poll(self):
+        events = self._drain()
+        if self.finished:
+            self.process.join(0) # Reap it if it has gone; never block the UI
+        elif self.deadline is not None and time.monotonic() > self.deadline:
+            self.terminate()
+            events.append(('cancelled', None))
+        elif self.process.exitcode is not None:
+            # It exited between the drain above and now, so its last events
+            # may only just have arrived
+            events.extend(self._drain())
+            exitcode = self.process.exitcode
+            finished = self.finished
+            self.terminate()
+            if not finished and exitcode != 0:
+                events.append(('error', 'Worker exited with code {0}'.format(exitcode)))
+        return events
+
+    def _drain(self):
+        events = []
+        while True:
+            try:
+                event = self.events.get_nowait()
+            except Empty:
+                return events
+            events.append(event)
+            if event[0] in ('done', 'cancelled', 'error'):
+                self.finished = True
+
+    def terminate(self):
+        # Stop the worker now and remove any output it was still writing
+        from osm import PARTIAL
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(CANCEL_TIMEOUT)
+            if self.process.is_alive():
+                self.process.kill() # Stuck somewhere SIGTERM can't reach
+        self.process.join()
+        for (osm_path, output_path) in self.jobs:
+            if os.path.exists(output_path + PARTIAL):
+                os.remove(output_path + PARTIAL)
+        self.finished = True
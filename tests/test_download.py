@@ -0,0 +1,135 @@
+import os
+import sys
+import unittest
+from hashlib import md5
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os.path import abspath, dirname, join
+from shutil import rmtree
+from tempfile import mkdtemp
+from threading import Thread
+
+sys.path.insert(0, join(dirname(dirname(abspath(__file__))), 'src'))
+
+try:
+    import urllib3
+except ImportError:
+    urllib3 = None
+
+import instrument
+from dsf_errors import ErrorDownload
+
+BODIES = {'/a': os.urandom(300000), '/b': os.urandom(200000)}
+BODIES['/copy'] = BODIES['/a']
+
+class Handler(BaseHTTPRequestHandler):
+    # Serves BODIES with a strong ETag, honouring If-None-Match, Range and
+    # If-Range. The first request for a path in server.cut is cut off after
+    # half its body.
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.requests.append((self.path, dict(self.headers)))
+        body = BODIES.get(self.path)
+        if body is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        etag = '"{0}"'.format(md5(body).hexdigest())
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        start = 0
+        if self.headers.get('Range') and self.headers.get('If-Range') in (None, etag):
+            start = int(self.headers['Range'].split('=')[1].rstrip('-'))
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {0}-{1}/{2}'.format(start, len(body) - 1, len(body)))
+        else:
+            self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body) - start))
+        self.end_headers()
+        if self.path in self.server.cut:
+            self.server.cut.remove(self.path)
+            self.wfile.write(body[start:start + len(body) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body[start:])
+
+@unittest.skipUnless(urllib3, 'urllib3 is not installed')
+class DownloaderTest(unittest.TestCase):
+    def setUp(self):
+        from download import Downloader
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.requests = []
+        self.server.cut = set()
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base = 'http://127.0.0.1:{0}'.format(self.server.server_address[1])
+        self.cache = mkdtemp(prefix='osmxp-cache-')
+        self.downloader = Downloader(self.cache, workers=2, timeout=5.0)
+        instrument.start('test', [])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        rmtree(self.cache, True)
+
+    def read(self, path):
+        with open(path, 'rb') as fd:
+            return fd.read()
+
+    def test_resume(self):
+        self.server.cut.add('/a')
+        path = self.downloader.fetch(self.base + '/a')
+        self.assertEqual(self.read(path), BODIES['/a'])
+        (first, second) = [headers for (url, headers) in self.server.requests]
+        self.assertNotIn('Range', first)
+        self.assertRegex(second['Range'], r'^bytes=[1-9][0-9]*-$') # Whole blocks that arrived before the cut
+        self.assertEqual(second['If-Range'], '"{0}"'.format(md5(BODIES['/a']).hexdigest()))
+        self.assertEqual(instrument.current.counters.get('download.resumed'), 1)
+        self.assertEqual(os.listdir(join(self.cache, 'partial')), [])
+
+    def test_revalidate(self):
+        path = self.downloader.fetch(self.base + '/b')
+        self.assertEqual(self.downloader.fetch(self.base + '/b'), path)
+        self.assertIn('If-None-Match', self.server.requests[-1][1])
+        self.assertEqual(instrument.current.counters.get('download.revalidated'), 1)
+        self.assertEqual(self.read(path), BODIES['/b'])
+
+    def test_dedupe(self):
+        paths = self.downloader.fetchAll([self.base + '/a', self.base + '/copy', self.base + '/b'])
+        self.assertEqual(paths[0], paths[1])
+        self.assertNotEqual(paths[0], paths[2])
+        self.assertEqual(len(os.listdir(join(self.cache, 'index'))), 3)
+        objects = [name for (folder, folders, names) in os.walk(join(self.cache, 'objects')) for name in names]
+        self.assertEqual(len(objects), 2)
+
+    def test_shared(self):
+        # Two downloaders on one cache fetching the same URL take turns
+        # on its partial file
+        from download import Downloader
+        other = Downloader(self.cache, workers=2, timeout=5.0)
+        self.server.cut.add('/a')
+        paths = []
+        threads = [Thread(target=lambda d: paths.append(d.fetch(self.base + '/a')), args=(d,)) for d in (self.downloader, other)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(paths)), 1)
+        self.assertEqual(self.read(paths[0]), BODIES['/a'])
+        self.assertEqual(os.listdir(join(self.cache, 'partial')), [])
+
+    def test_missing(self):
+        self.assertRaises(ErrorDownload, self.downloader.fetch, self.base + '/missing')
+        self.assertEqual(len(self.server.requests), 1) # Not retried
+        self.assertEqual(os.listdir(join(self.cache, 'partial')), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import os
+import sys
+import unittest
+from os.path import abspath, dirname, join
+from shutil import rmtree
+from tempfile import mkdtemp
+
+sys.path.insert(0, join(dirname(dirname(abspath(__file__))), 'src'))
+
+from osm import convert
+
+NODES = 2500 # More than two batches, so counts have to add up across batches
+WAYS = 1200
+
+def extract(path):
+    # NODES nodes on a line and WAYS roads of three nodes each
+    fd = open(path, 'w')
+    try:
+        fd.write('<?xml version="1.0" encoding="UTF-8"?>\n<osm version="0.6">\n')
+        for i in range(NODES):
+            fd.write('<node id="{0}" lat="51.{1:04d}" lon="-4.{1:04d}"/>\n'.format(i + 1, i))
+        for i in range(WAYS):
+            fd.write('<way id="{0}"><nd ref="{1}"/><nd ref="{2}"/><nd ref="{3}"/>'
+                     '<tag k="highway" v="residential"/></way>\n'.format(i + 1, i + 1, i + 2, i + 3))
+        fd.write('</osm>\n')
+    finally:
+        fd.close()
+
+class ConvertTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = mkdtemp(prefix='osmxp-test-')
+        self.osm_path = join(self.folder, 'extract.osm')
+        self.output_path = join(self.folder, 'roads.txt')
+        extract(self.osm_path)
+
+    def tearDown(self):
+        rmtree(self.folder, True)
+
+    def test_items(self):
+        stages = dict([(stage['stage'], stage) for stage in convert(self.osm_path, self.output_path)])
+        self.assertEqual(stages['read']['items'], os.path.getsize(self.osm_path))
+        self.assertEqual(stages['geometry']['items'], NODES + WAYS) # Elements, not batches
+        self.assertEqual(stages['write']['items'], WAYS)
+        with open(self.output_path) as fd:
+            self.assertEqual(len(fd.readlines()), WAYS)
+
+if __name__ == '__main__':
+    unittest.main()